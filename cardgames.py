@@ -88,7 +88,12 @@ class Deck(list):
     """
     suites = ["spades", "hearts", "diamonds", "clubs"]
     def __init__(self, n=1, start=7):
-        ranks = [str(n) for n in range(start, 11)] + ["jack", "queen", "king", "ace"]
-        base_deck = list(map(lambda c: Card(*c), list(product(ranks, Deck.suites)))) * n
+        # Build n separate copies, so that every physical card is its own object
+        # and list.remove() never confuses two identical cards from different decks.
+        base_deck = [Card(*c) for _ in range(n) for c in product(Deck.ranks(start), Deck.suites)]
         shuffle(base_deck)
         super().__init__(base_deck)
+    @staticmethod
+    def ranks(start=7):
+        "The ranks of a deck starting at start, in ascending order."
+        return [str(n) for n in range(start, 11)] + ["jack", "queen", "king", "ace"]
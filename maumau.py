@@ -1,9 +1,9 @@
 #!/usr/bin/python3
 
 from cardgames import Card, Hand, Deck
-from itertools import cycle
+from itertools import product
 from collections import deque
-from random import randint, shuffle
+from random import randrange, shuffle
 import time
 import os
 import sys
@@ -15,10 +15,11 @@ class MessageHandler(object):
     """
     MessageHandler handles writing messages to different areas of the screen.
     push(msg) pushes msg to the queue on the right hand side, while user_message(msg)
-    posts to the bottom area, below the displayed cards
+    posts to the bottom area, below the displayed cards, in the given row.
     """
-    def __init__(self):
+    def __init__(self, row=26):
         self.messages = deque([], maxlen=20)
+        self.row = row
     def push(self, text):
         self.messages.append(text)
         for row, line in enumerate(self.messages, start=2):
@@ -26,8 +27,8 @@ class MessageHandler(object):
             sys.stdout.write("\x1b7\x1b[%d;%df%s\x1b8" % (row, 60, line))
             sys.stdout.flush()
     def user_message(self, msg=""):
-        print("\033[30;1H") # Place the (invisible) cursor at line 30, column 1
-        print("\x1b7\x1b[%d;%df%s\x1b8" % (26, 5, "{:<54}".format(msg)))
+        print("\033[%d;1H" % (self.row + 4)) # Park the (invisible) cursor below the message
+        print("\x1b7\x1b[%d;%df%s\x1b8" % (self.row, 5, "{:<54}".format(msg)))
 
 class MauMau(Exception):
     """
@@ -41,6 +42,158 @@ class GameAbort(Exception):
     """
     pass
 
+class Effect(object):
+    """
+    Base class for special cards. An effect is bound to a rank and keeps its own
+    state on the game object. The Rules() object calls the hooks below at the
+    appropriate points of a turn:
+    reset(game)                 the card on top is not (or no longer) one of ours
+    setup(game)                 the first card in the middle is one of ours
+    played(player, card)        player has just played one of our cards
+    before_move(player)         start of player's turn, return True to skip it
+    before_play(player, card)   player is about to play card
+    Every hook is called for every effect, in the order of Rules().effects,
+    even if an earlier effect has already decided to skip the turn.
+    """
+    rank = None
+    wild = False    # wild cards may be played on any card
+    priority = 0    # AI players play cards with lower priority first
+    def reset(self, game):
+        pass
+    def setup(self, game):
+        pass
+    def played(self, player, card):
+        pass
+    def before_move(self, player):
+        return False
+    def before_play(self, player, card):
+        pass
+
+class Seven(Effect):
+    """
+    The next player has to draw two cards, unless he responds with a seven of
+    his own, in which case the penalty adds up for the player after him.
+    """
+    rank = "7"
+    priority = -2
+    def reset(self, game):
+        game.sevens = 0
+    def setup(self, game):
+        game.sevens = 1
+    def played(self, player, card):
+        player.game.sevens += 1
+    def before_move(self, player):
+        # We leave the choice to respond with a seven (if there is one) to the
+        # player, hence, we only draw right away if there is no other possibility.
+        if player.game.sevens and not any(c.rank == self.rank for c in player.cards):
+            player.handle_sevens()
+        return False
+    def before_play(self, player, card):
+        # The player chose not to respond to an "active" 7, even if he could
+        # have. Now live with it and draw 2(n) cards.
+        if player.game.sevens and card.rank != self.rank:
+            player.handle_sevens()
+
+class Eight(Effect):
+    """
+    The next player has to skip one round.
+    """
+    rank = "8"
+    priority = -1
+    def reset(self, game):
+        game.eights = 0
+    def setup(self, game):
+        game.eights = 1
+    def played(self, player, card):
+        player.game.eights = 1
+    def before_move(self, player):
+        # Skip this round if the 8 is still effective, that is, if no other
+        # player before us has skipped because of this card.
+        if player.game.eights:
+            player.message.push("{} has to skip one round.".format(player.name))
+            player.game.eights = 0
+            return True
+        return False
+
+class Jack(Effect):
+    """
+    A jack may be played on any card, and the player gets to wish the suite
+    that has to be played next. Not part of the default rules, add it with
+    e.g. Game(rules=Rules(Rules.default + [Jack()])).
+    """
+    rank = "jack"
+    wild = True
+    priority = 1    # jacks are too valuable to waste them early
+    def reset(self, game):
+        game.wish = None
+    def played(self, player, card):
+        # Nobody cares about the wish once the game is over anyway.
+        if player.cards:
+            player.game.wish = player.wish()
+            player.message.push("{} wishes {}.".format(player.name, player.game.wish))
+
+class Reverse(Effect):
+    """
+    Reverse the direction of play. Not part of the default rules, add it with
+    e.g. Game(rules=Rules(Rules.default + [Reverse("9")])).
+    """
+    priority = -1
+    def __init__(self, rank="9"):
+        self.rank = rank
+    def played(self, player, card):
+        player.game.direction = -player.game.direction
+        player.message.push("The direction of play is reversed.")
+
+class Rules(object):
+    """
+    The rule book: Knows the special cards and which card may be played on
+    which. Every distinct card (rank, suite) gets a code, and masks[code] is a
+    bitmask with bit i set if the card with code i may be played on top of it.
+    wish_masks[suite] is the analogous mask while a jack's wish is in effect.
+    Those masks are computed once, so checking a card is a dict lookup and
+    a bit test, no matter how many players or decks are in the game.
+    """
+    default = [Seven(), Eight()]
+    def __init__(self, effects=None, start=7):
+        self.effects = list(Rules.default if effects is None else effects)
+        # Several effects may share a rank: Such a card is wild if any of its
+        # effects is, and gets the lowest of their priorities.
+        self.special = {}
+        for effect in self.effects:
+            self.special.setdefault(effect.rank, []).append(effect)
+        keys = list(product(Deck.ranks(start), Deck.suites))
+        self.codes = {key: code for code, key in enumerate(keys)}
+        wild = 0
+        for code, (rank, suite) in enumerate(keys):
+            if any(effect.wild for effect in self.special.get(rank, [])):
+                wild |= 1 << code
+        def mask(condition):
+            return wild | sum(1 << code for code, key in enumerate(keys) if condition(*key))
+        self.masks = [mask(lambda r, s: r == rank or s == suite) for rank, suite in keys]
+        self.wish_masks = {suite: mask(lambda r, s: s == suite) for suite in Deck.suites}
+    def code(self, card):
+        return self.codes[card.rank, card.suite]
+    def priority(self, card):
+        return min([effect.priority for effect in self.special.get(card.rank, [])], default=0)
+    def setup(self, game, card):
+        for effect in self.effects:
+            effect.reset(game)
+            if card.rank == effect.rank:
+                effect.setup(game)
+    def before_move(self, player):
+        # No short cut: Every effect gets to see every turn.
+        skips = [effect.before_move(player) for effect in self.effects]
+        return any(skips)
+    def before_play(self, player, card):
+        for effect in self.effects:
+            effect.before_play(player, card)
+    def played(self, player, card):
+        for effect in self.effects:
+            if card.rank == effect.rank:
+                effect.played(player, card)
+            else:
+                effect.reset(player.game)
+
 class Player(object):
     """
     Base class for player objects. Encapsulates the core game mechanics of drawing
@@ -54,13 +207,18 @@ class Player(object):
     def take_card(self):
         """
         Take a card from the deck. If the deck is empty, take the bottom n-1 cards
-        from the central stack and shuffle them to get a new deck.
+        from the central stack and shuffle them to get a new deck. If there are
+        no cards left at all (crowded tables), there is nothing to draw.
+        Returns True if we got a card.
         """
         if not self.game.deck:
             self.game.deck = self.game.central_stack[:-1]
-            self.game.central_stack = [self.game.central_stack[-1]]
+            self.game.central_stack = Hand([self.game.central_stack[-1]], style="top")
             shuffle(self.game.deck)
-        self.cards.append(self.game.deck.pop())
+        if self.game.deck:
+            self.cards.append(self.game.deck.pop())
+            return True
+        return False
     def handle_sevens(self):
         """
         Take 2n cards from the deck if there are n "active" sevens in the middle.
@@ -71,63 +229,54 @@ class Player(object):
         self.message.push("{} has to draw {} cards!".format(self.name, 2 * self.game.sevens))
         self.game.sevens = 0
         print(self.game)
-    def matches(self, top_card):
-        matching_suite = [c for c in self.cards if c.suite == top_card.suite]
-        matching_rank = [c for c in self.cards if c.rank == top_card.rank]
-        return matching_suite, matching_rank
     def move(self):
         """
         Automates the players choices as far as possible regardless of if it is
         a human or AI player. Returns True, if we have to skip one round, False,
         if the player has to pass, and None otherwise.
         """
-        top_card = self.game.central_stack[-1]
-        # If the top card is a 8, we have to skip this round if the 8 is still
-        # effective, that is, if no other player before us has skipped because
-        # of this card.
-        if self.game.eights:
-            self.message.push("{} has to skip one round.".format(self.name))
-            self.game.eights = 0
+        # Let the special cards have their say first (skip a round, draw cards...)
+        if self.game.rules.before_move(self):
             return True
-        # If the top card is a 7, we can avoid having to draw 2(n) cards if we play
-        # a 7 of our own. However, we leave this choice (if there is one) to the
-        # player, hence, we call handle_sevens only if there is no other possibility
-        elif top_card.rank == "7" and self.game.sevens:
-            sevens = [c for c in self.cards if c.rank == "7"]
-            if not sevens:
-                self.handle_sevens()
         # Now look if we have matching cards. If not, draw a card from the deck.
-        matching_suite, matching_rank = self.matches(top_card)
-        if not matching_suite and not matching_rank:
-            self.take_card()
-            self.message.push("{} has to draw a card.".format(self.name))
+        drew = True
+        if not self.game.playable(self.cards):
+            drew = self.take_card()
+            if drew:
+                self.message.push("{} has to draw a card.".format(self.name))
+            else:
+                self.message.push("{} can't draw a card.".format(self.name))
             print(self.game)
         # Look (possibly) again for a match. If there is none, we have to pass.
-        matching_suite, matching_rank = self.matches(top_card)
-        if not matching_suite and not matching_rank:
+        # Count the passes without even a card to draw: After a full round of
+        # those, nothing will ever change again.
+        if not self.game.playable(self.cards):
             self.message.push("{} has to pass.".format(self.name))
+            self.game.stuck = 0 if drew else self.game.stuck + 1
             return False
         # At this point, there is (possibly) a choice left to the player, which
         # may differ for AI and human players. Therefore, we return None.
         return None
     def play(self, card):
         """
-        Play out a card, announce that we have won by raising MauMau, increment
-        and decrement the counters of unhandeled sevens and eights
+        Play out a card, let the rules update the effects of special cards and
+        announce that we have won by raising MauMau.
         """
+        self.game.rules.before_play(self, card)
+        self.game.stuck = 0
         self.cards.remove(card)
         self.game.central_stack.append(card)
         self.message.push("{} plays {} of {}.".format(self.name, card.rank, card.suite))
-        if card.rank == "7":
-            self.game.sevens += 1
-        else:
-            self.game.sevens = 0
-        if card.rank == "8":
-            self.game.eights = 1
-        else:
-            self.game.eights = 0
+        self.game.rules.played(self, card)
         if not self.cards:
             raise MauMau
+    def wish(self):
+        """
+        Choose a suite after playing a jack: The suite we have the most
+        (ordinary) cards of.
+        """
+        suites = [c.suite for c in self.cards if c.rank not in self.game.rules.special]
+        return max(Deck.suites, key=suites.count)
     def __repr__(self):
         return self.cards.repr(style=self.style)
 
@@ -143,28 +292,13 @@ class AIPlayer(Player):
         auto_decision = super().move()
         if auto_decision is not None:
             return
+        # Select next best a****** move: Special cards according to their
+        # priority (this always responds to an "active" seven with a seven),
+        # and among the rest, prefer to stay in the suite.
         top_card = self.game.central_stack[-1]
-        # Always respond to an "active" seven with a seven
-        if top_card.rank == "7" and self.game.sevens:
-            sevens = [c for c in self.cards if c.rank == "7"]
-            if sevens:
-                self.play(sevens[0])
-                return
-            else:
-                self.handle_sevens()
-        # Otherwise, select next best a****** move
-        matching_suite, matching_rank = self.matches(top_card)
-        if matching_suite:
-            sevens = [c for c in matching_suite if c.rank == "7"]
-            eights = [c for c in matching_suite if c.rank == "8"]
-            if sevens:
-                self.play(sevens[0])
-            elif eights:
-                self.play(eights[0])
-            else:
-                self.play(matching_suite[0])
-        elif matching_rank:
-            self.play(matching_rank[0])
+        card = min(self.game.playable(self.cards),
+                   key=lambda c: (self.game.rules.priority(c), c.suite != top_card.suite))
+        self.play(card)
         return
 
 class HumanPlayer(Player):
@@ -203,12 +337,6 @@ class HumanPlayer(Player):
                 card_index = self.get_user_input()
                 card = self.cards(card_index)
                 if self.game.is_legal(card):
-                    if card.rank != "7" and self.game.sevens:
-                        # The user chose not to respond to an "active" 7, even
-                        # if he could have. Now live with it and draw 2(n) cards.
-                        self.handle_sevens()
-                    self.play(card)
-                    self.message.user_message("")
                     break
                 else:
                     # You selected an invalid card, dumbass!
@@ -222,21 +350,60 @@ class HumanPlayer(Player):
                     raise GameAbort
                 else:
                     continue
+        # Play outside of the loop, so that quitting during a jack's wish ends
+        # the game instead of asking for another card.
+        self.play(card)
+        self.message.user_message("")
+    def wish(self):
+        """
+        Ask the user for a suite after playing a jack.
+        """
+        msg = "Wish a suite! [" + ", ".join("{} {}".format(i, Card.symbols[s])
+                                            for i, s in enumerate(Deck.suites, start=1)) + "]"
+        while True:
+            try:
+                char = self.get_user_input(msg)
+            except GameAbort:
+                char = self.get_user_input("Do you really want to quit the game? [y/n]")
+                if char.lower() == "y":
+                    raise GameAbort
+                else:
+                    continue
+            if char and char in "1234":
+                self.message.user_message("")
+                return Deck.suites[int(char) - 1]
 
 class Game(object):
     """
     Game is the class encapsulating the game logic of (counterclockwise) rounds
     of the players in Game().player_list, breaking out of the endless loop in
-    Game().play() only if either MauMau or GameAbort is raised.
+    Game().play() only if either MauMau or GameAbort is raised, or if nobody
+    can play or draw a card for a full round (a draw).
     """
-    def __init__(self, demo=False):
+    names = ["Fritz", "Franz", "Hans", "Heinz", "Kurt", "Otto", "Willi", "Karl", "Paul"]
+    def __init__(self, demo=False, players=3, decks=None, rules=None):
         """
         Sets the stage: Shuffles the deck, hands out 7 cards to each player
         and places a card in the middle.
-        demo = True creates a game with 3 AI players.
+        demo = True creates a game with AI players only.
+        players is the number of seats at the table, the last one being Horst.
+        decks is the number of 32 card decks to play with. By default, we take
+        enough decks to keep at most 2 cards in the hands per card left on the
+        stack (the classic 3 player game has 21 to 11), otherwise crowded tables
+        run dry.
+        rules is a Rules() object, by default sevens and eights are special.
+        Raises ValueError if there are fewer decks than that: With too few cards
+        left to draw, the same cards (e.g. a bunch of sevens) can go round and
+        round forever.
         """
-        self.message = MessageHandler()
-        self.deck = Deck()
+        needed = -(-21 * players // 64) # ceil(1.5 * 7 * players / 32)
+        if decks is None:
+            decks = needed
+        if decks < needed:
+            raise ValueError("{} players need at least {} deck(s)".format(players, needed))
+        self.rules = rules or Rules()
+        self.message = MessageHandler(row=7 * players + 5)
+        self.deck = Deck(decks)
         self.central_stack = Hand(style="top")
         if not demo:
             self.horst = HumanPlayer(self, "Horst")
@@ -244,30 +411,38 @@ class Game(object):
             # Patch "Horst" to be an AIPlayer with the same __repr__ as a human player
             self.horst = AIPlayer(self, "Horst")
             self.horst.cards.style = "horizontal"
-        self.player_list = [AIPlayer(self, "Fritz"), AIPlayer(self, "Franz"), self.horst]
-        self.players = cycle(self.player_list)
+        names = (Game.names + ["P{}".format(i) for i in range(len(Game.names), players)])[:players - 1]
+        self.player_list = [AIPlayer(self, name) for name in names] + [self.horst]
+        self.direction = 1
+        self.stuck = 0 # number of passes in a row without a card to draw
+        self.wish = None
         # When simulating 3 random players a million times, it turns out that the
         # last player has a 2% handicap compared to the others. Hence: Random beginner.
-        for _ in range(randint(0, 2)):
-            next(self.players)
+        self.seat = randrange(players)
         # Distribute cards.
         for _ in range(7):
-            for _ in range(3):
-                self.current_player = next(self.players)
-                self.current_player.take_card()
+            for player in self.player_list:
+                player.take_card()
+        self.current_player = self.player_list[self.seat]
         self.central_stack.append(self.deck.pop())
-        # Set up central counters for the number of unhandeled sevens and eights.
-        if self.central_stack[-1].rank == "7":
-            self.sevens = 1
-        else:
-            self.sevens = 0
-        if self.central_stack[-1].rank == "8":
-            self.eights = 1
-        else:
-            self.eights = 0
+        # Set up the state of the special cards, e.g. the counters for the number
+        # of unhandeled sevens and eights.
+        self.rules.setup(self, self.central_stack[-1])
+    def legal_mask(self):
+        """
+        Bitmask of the cards which may currently be played, see Rules().
+        """
+        if self.wish:
+            return self.rules.wish_masks[self.wish]
+        return self.rules.masks[self.rules.code(self.central_stack[-1])]
     def is_legal(self, card):
-        top_card = self.central_stack[-1]
-        return top_card.suite == card.suite or top_card.rank == card.rank
+        return self.legal_mask() >> self.rules.code(card) & 1
+    def playable(self, cards):
+        mask = self.legal_mask()
+        return [c for c in cards if mask >> self.rules.code(c) & 1]
+    def next_player(self):
+        self.seat = (self.seat + self.direction) % len(self.player_list)
+        return self.player_list[self.seat]
     def play(self):
         skipped = False
         length = 0
@@ -276,7 +451,7 @@ class Game(object):
             # Print the game
             print(self)
             # Next player
-            self.current_player = next(self.players)
+            self.current_player = self.next_player()
             time.sleep(1)
             try:
                 self.current_player.move()
@@ -292,15 +467,21 @@ class Game(object):
             except GameAbort:
                 self.message.user_message("Thank you for playing!")
                 break
+            if self.stuck >= len(self.player_list):
+                print(self)
+                self.message.push("Nobody can move anymore.")
+                self.message.user_message("It's a draw!")
+                return None, length
         return self.current_player.name, length
 
     def __repr__(self):
         """
-        Representing unicode string for the game: First row is Fritz, then Franz, then Horst (the human player).
+        Representing unicode string for the game: One row per AI player, the last one is Horst (the human player).
         """
         anchor = "\x1b7\x1b[1;1f" # ANSI escape sequence to start at row 1, columm 1
         cards = "\n".join([str(player) for player in self.player_list]) # the players' cards
-        center = [""] * 4 + [(" " * 7) + line for line in str(self.central_stack).splitlines()] + [""]*12 # the central stack gets printed in the middle
+        center = [""] * 4 + [(" " * 7) + line for line in str(self.central_stack).splitlines()] # the central stack gets printed in the middle
+        center += [""] * (7 * len(self.player_list) - len(center))
         # Join everything up.
         all = "\n".join([anchor] + [c + l for c, l in zip(cards.splitlines(), center)] +
                 ["{:<59}".format("  ".join(["{:>2}".format(Hand.alphabet[i].upper()) for i in range(len(self.horst.cards))]))] + ["\x1b8"])
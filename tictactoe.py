@@ -12,23 +12,73 @@ class Board(list):
     (like "A2") instead of index.
     """
     LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    def __init__(self, dimension):
+    # Down, right and the two diagonals, as (row, column) steps
+    DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+    def __init__(self, dimension, k=None):
+        if k is None:
+            k = dimension
+        if not 1 <= k <= dimension:
+            raise ValueError("k has to be between 1 and {}".format(dimension))
         self.dimension = dimension
+        self.k = k
         self.letters = list(Board.LETTERS[:dimension])
         self.rows = list(reversed(range(1, dimension + 1)))
         self.fields = [l + str(d) for l, d in product(self.letters, self.rows)]
         # this is the important part: build a matrix filled with blanks
         super().__init__([[Game.BLANK for _ in range(dimension)] for _ in range(dimension)])
+        # Every line of k consecutive fields is a window. We remember which
+        # windows go through which field, and keep count of the X's and O's in
+        # every window, so that a move only has to update the windows through
+        # it and nobody ever has to scan the whole board.
+        self.windows = []
+        self.through = {field: [] for field in product(range(dimension), repeat=2)}
+        for (row, column), (dr, dc) in product(self.through, Board.DIRECTIONS):
+            window = [(row + dr * i, column + dc * i) for i in range(self.k)]
+            if self.inside(*window[-1]):
+                for field in window:
+                    self.through[field].append(len(self.windows))
+                self.windows.append(window)
+        self.counts = {Game.X: [0] * len(self.windows), Game.O: [0] * len(self.windows)}
+    def field_index(self, address):
+        "Translate an address like 'A2' to (row, column) indices"
+        return self.dimension - int(address[1:]), self.letters.index(address[0])
+    def address(self, row, column):
+        "Translate (row, column) indices to an address like 'A2'"
+        return self.letters[column] + str(self.dimension - row)
+    def inside(self, row, column):
+        return 0 <= row < self.dimension and 0 <= column < self.dimension
+    def place(self, row, column, symbol):
+        "Put symbol on the field (row, column)"
+        self[row][column] = symbol
+        counts = self.counts[symbol]
+        for window in self.through[row, column]:
+            counts[window] += 1
+    def erase(self, row, column):
+        "Clear the field (row, column) again"
+        counts = self.counts[self[row][column]]
+        self[row][column] = Game.BLANK
+        for window in self.through[row, column]:
+            counts[window] -= 1
+    def complete(self, row, column):
+        "Is the mark on (row, column) part of a full window of k equal marks?"
+        counts = self.counts[self[row][column]]
+        return any(counts[window] == self.k for window in self.through[row, column])
+    def neighbours(self, row, column, distance=2):
+        "Blank fields at most distance steps away from (row, column)"
+        return [(r, c) for r in range(row - distance, row + distance + 1)
+                       for c in range(column - distance, column + distance + 1)
+                       if self.inside(r, c) and self[r][c] == Game.BLANK]
     def __call__(self, address, value=None):
         """
         Read/write the board by address instead of index.
         Example: If b = Board(3), b('A2') is the value of the field 'A2', and
         b('C3', 'X') sets the field 'C3' to 'X'
         """
+        row, column = self.field_index(address)
         if value:
-            self[self.dimension - int(address[1:])][self.letters.index(address[0])] = value
+            self.place(row, column, value)
         else:
-            return self[self.dimension - int(address[1:])][self.letters.index(address[0])]
+            return self[row][column]
     def __repr__(self):
         """
         Generate a representation string so we can print the board by simply
@@ -44,17 +94,217 @@ class Board(list):
                             for j, s in zip(self.rows, self)])
         return "".join([anchor, top, interior, bottom])
 
+class ThreatSearch(object):
+    """
+    Computer player based on threat-space search. Instead of looking at every
+    field, it only considers forcing moves, i.e. moves which make a four
+    (k - 1 marks in a window, the last field blank) or a three (a move after
+    which we could make two fours at once), and assumes the opponent answers
+    only in the fields which actually stop the threat. If such a sequence of
+    threats wins by force, we play it. Otherwise we spoil the opponent's
+    forced win, if there is one, or pick the best looking field near the
+    marks already on the board.
+    The search is not exact (counter threats of the defender are only taken
+    into account if they are fours), but it is fast, and a node budget per
+    search keeps the latency at bay on big boards.
+    """
+    def __init__(self, game, symbol, depth=8, budget=2000):
+        self.game = game
+        self.board = game.board
+        self.k = game.board.k
+        self.symbol = symbol
+        self.depth = depth
+        self.budget = budget
+    @staticmethod
+    def other(symbol):
+        return Game.O if symbol == Game.X else Game.X
+    def blanks(self, window):
+        return [(row, column) for row, column in self.board.windows[window]
+                              if self.board[row][column] == Game.BLANK]
+    def lines(self, symbol, cell, marks):
+        "The windows through cell with the given number of marks of symbol and none of the opponent"
+        own, other = self.board.counts[symbol], self.board.counts[ThreatSearch.other(symbol)]
+        return [window for window in self.board.through[cell] if own[window] == marks and not other[window]]
+    def wins(self, symbol, cell):
+        "Would playing symbol at the (blank) field cell make k in a row?"
+        return bool(self.lines(symbol, cell, self.k - 1))
+    def gains(self, symbol, cell):
+        """
+        The fields which would complete a window for symbol if symbol played
+        at the (blank) field cell.
+        """
+        return {field for window in self.lines(symbol, cell, self.k - 2)
+                      for field in self.blanks(window) if field != cell}
+    def double(self, symbol, cells):
+        "Is there a field in cells where symbol could make two fours at once?"
+        return any(len(self.gains(symbol, cell)) > 1 for cell in cells
+                   if self.board[cell[0]][cell[1]] == Game.BLANK)
+    def threat(self, symbol, cell, threes=True):
+        """
+        Classify the threat of playing symbol at the (blank) field cell.
+        Returns the fields the opponent has to choose from to defend, or None
+        if this is not a threat at all. An empty list means there is no defense.
+        Threes only count if threes is True.
+        """
+        gains = self.gains(symbol, cell)
+        if gains:
+            return list(gains) if len(gains) == 1 else []
+        if self.k < 4 or not threes:
+            # With fewer than 4 in a row, every single mark would be a three.
+            return None
+        # Look for a three: after playing cell, fields in windows with k - 2
+        # of our marks where we could make a double four next.
+        self.board.place(*cell, symbol)
+        cells = {field for window in self.lines(symbol, cell, self.k - 2) for field in self.blanks(window)}
+        fours = [field for field in cells if len(self.gains(symbol, field)) > 1]
+        defenses = None
+        if fours:
+            # A defense is a field which takes away all of those double fours.
+            # Besides the fields in the windows, this can be one step beyond.
+            candidates = cells.union(*(self.board.neighbours(*field, 1) for field in fours))
+            opponent = ThreatSearch.other(symbol)
+            defenses = []
+            for field in candidates:
+                self.board.place(*field, opponent)
+                if not any(len(self.gains(symbol, four)) > 1 for four in fours if four != field):
+                    defenses.append(field)
+                self.board.erase(*field)
+        self.board.erase(*cell)
+        return defenses
+    def finish(self, symbol, last):
+        """
+        A field where symbol wins right away. We only ever look for those
+        before the search starts, so afterwards a win can only come from
+        the windows through the last mark symbol has played.
+        """
+        for window in self.lines(symbol, last, self.k - 1):
+            return self.blanks(window)[0]
+        return None
+    def attack(self, symbol, depth, cells, last, quiet):
+        """
+        Search for a sequence of threats which wins by force for symbol. cells
+        is the set of fields to consider, last the last mark symbol has played.
+        quiet tells if the opponent has no three: Otherwise, he would answer a
+        three of ours with a four of his own and win first, so only fours
+        count. Returns the first move of the sequence, or None if there is none
+        (within depth and budget).
+        """
+        cell = self.finish(symbol, last) if last else None
+        if cell or depth == 0:
+            return cell
+        # Only fields in windows which are about to fill up can be threats,
+        # try the fours first.
+        own, other = self.board.counts[symbol], self.board.counts[ThreatSearch.other(symbol)]
+        candidates = []
+        for cell in cells:
+            if self.board[cell[0]][cell[1]] == Game.BLANK:
+                marks = max([own[window] for window in self.board.through[cell] if not other[window]], default=0)
+                if marks >= self.k - (3 if quiet else 2):
+                    candidates.append((-marks, cell))
+        for _, (row, column) in sorted(candidates):
+            if self.nodes > self.budget:
+                return None
+            self.nodes += 1
+            defenses = self.threat(symbol, (row, column), quiet)
+            if defenses is None:
+                continue
+            self.board.place(row, column, symbol)
+            neighbourhood = cells.union(self.board.neighbours(row, column))
+            won = all(self.refuted(symbol, defense, depth, neighbourhood, (row, column), quiet)
+                      for defense in defenses)
+            self.board.erase(row, column)
+            if won:
+                return row, column
+        return None
+    def refuted(self, symbol, defense, depth, cells, last, quiet):
+        "Does the attack of symbol (last played at last) still win if the opponent defends at defense?"
+        opponent = ThreatSearch.other(symbol)
+        if self.wins(opponent, defense):
+            return False
+        self.board.place(*defense, opponent)
+        if self.lines(opponent, defense, self.k - 1):
+            # The defense made a four, so we have to win right now.
+            won = self.finish(symbol, last) is not None
+        else:
+            # Did the defense make a three?
+            quiet = quiet and not self.double(opponent, [field for window in self.lines(opponent, defense, self.k - 2)
+                                                               for field in self.blanks(window)])
+            cells = cells.union(self.board.neighbours(*defense))
+            won = self.attack(symbol, depth - 1, cells, last, quiet) is not None
+        self.board.erase(*defense)
+        return won
+    def search(self, symbol, cells):
+        "Look for a forced win of symbol, with a fresh node budget"
+        self.nodes = 0
+        quiet = not self.double(ThreatSearch.other(symbol), cells)
+        return self.attack(symbol, self.depth, cells, None, quiet)
+    def score(self, cell):
+        """
+        Rate a field by the windows it is part of: The more of our own (or the
+        opponent's) marks a window already has, the better.
+        """
+        own = self.board.counts[self.symbol]
+        other = self.board.counts[ThreatSearch.other(self.symbol)]
+        score = 0
+        for window in self.board.through[cell]:
+            if not other[window]:
+                score += 4 ** (own[window] + 1)
+            if not own[window]:
+                score += 4 ** other[window]
+        return score
+    def move(self):
+        "Choose a move and return its address"
+        cells = set(self.game.near)
+        if not cells:
+            # Empty board: take the center.
+            center = self.board.dimension // 2
+            return self.board.address(center, center)
+        opponent = ThreatSearch.other(self.symbol)
+        # Win if we can, otherwise stop the opponent from winning right away.
+        for symbol in [self.symbol, opponent]:
+            for cell in cells:
+                if self.wins(symbol, cell):
+                    return self.board.address(*cell)
+        cell = self.search(self.symbol, cells)
+        if cell:
+            return self.board.address(*cell)
+        ranking = sorted(cells, key=self.score, reverse=True)
+        threat = self.search(opponent, cells)
+        if threat:
+            # The opponent has a forced win. Try the fields which matter for
+            # it (and our own fours, which buy time) until one spoils it.
+            defenses = self.threat(opponent, threat) or []
+            spoilers = [threat] + defenses + [cell for cell in ranking if self.gains(self.symbol, cell)]
+            for cell in spoilers + ranking[:3]:
+                self.board.place(*cell, self.symbol)
+                spoiled = self.search(opponent, cells.union(self.board.neighbours(*cell))) is None
+                self.board.erase(*cell)
+                if spoiled:
+                    return self.board.address(*cell)
+            return self.board.address(*threat)
+        return self.board.address(*ranking[0])
+
 class Game(object):
     """
-    Encapsulates the game logic. Game(p1, p2, dim) sets up a game on a grid of
-    dim rows and columns between players named p1 and p2.
+    Encapsulates the game logic. Game(p1, p2, dim, k) sets up a game on a grid of
+    dim rows and columns between players named p1 and p2, where whoever gets k
+    marks in a row (by default a full row) wins. If computer is Game.X or
+    Game.O, the computer plays that symbol.
     """
     BLANK = " "
     X = "X"
     O = "O"
-    def __init__(self, player1, player2, dimension):
+    def __init__(self, player1, player2, dimension, k=None, computer=None):
         self.dimension = dimension
-        self.board = Board(dimension)
+        self.board = Board(dimension, k)
+        # The last move, the number of moves, and the blank fields close to
+        # any mark, so we never have to scan the whole board.
+        self.last = None
+        self.moves = 0
+        self.near = set()
+        self.computer = computer
+        if computer:
+            self.ai = ThreatSearch(self, computer)
         # cycle(it) is a generator which cycles through the elements of it.
         # In our case, we cycle through the player names along with their
         # symbols and store the current player in self.current_player
@@ -64,12 +314,14 @@ class Game(object):
         for _ in range(2 * dimension + 3):
             print()
     def check(self, symbol):
-        "Checks if the player using the symbol 'symbol' has won"
-        rows = any([all([mark == symbol for mark in row]) for row in self.board])
-        columns = any([all([row[column] == symbol for row in self.board]) for column in range(self.dimension)])
-        diagonals = (all([self.board[j][j] == symbol for j in range(self.dimension)])
-                     or all([self.board[j][self.dimension-1-j] == symbol for j in range(self.dimension)]))
-        return rows or columns or diagonals
+        """
+        Checks if the player using the symbol 'symbol' has won. Only the last
+        move can have completed a line, so we only look at the lines through it.
+        """
+        if self.last is None:
+            return False
+        row, column = self.last
+        return self.board[row][column] == symbol and self.board.complete(row, column)
     def over(self):
         """
         Check if the game is over. Return the winner if there is one, raise an
@@ -81,12 +333,16 @@ class Game(object):
             # Remember: First component of self.current_player is the player's name
             winner = self.current_player[0]
         # No blank field left and no winner -> draw
-        if not Game.BLANK in [s for row in self.board for s in row] and not winner:
+        if self.moves == self.dimension ** 2 and not winner:
             raise ValueError
         return winner
     def move(self, move):
         "Move the current player's symbol to the board"
         self.board(move, self.current_player[1])
+        self.last = self.board.field_index(move)
+        self.moves += 1
+        self.near.discard(self.last)
+        self.near.update(self.board.neighbours(*self.last))
     def legal(self, move):
         "Check if the chosen move is a legal one"
         if not move in self.board.fields:
@@ -103,7 +359,10 @@ class Game(object):
         over to the next player.
         """
         print(self.board)
-        while True:
+        if self.current_player[1] == self.computer:
+            move = self.ai.move()
+            print("{} plays {}.".format(self.current_player[0], move))
+        while self.current_player[1] != self.computer:
             # Remember: First component of self.current_player is the player's name
             move = input("{}, enter your move: ".format(self.current_player[0]))
             if self.legal(move):
@@ -141,6 +400,7 @@ if __name__ == "__main__":
     os.system("clear")
     player1 = input("Player 1, what's your name? [Dickmilch] ")
     player2 = input("Player 2, what's your name? [Biene] ")
+    computer = input("Should the computer play for player 2 (y/n)? [n] ")
     dimension = input("How big should the board be? [3] ")
     # Set default values in case a player has just hit enter
     if player1 == "":
@@ -151,10 +411,24 @@ if __name__ == "__main__":
         dimension = 3
     else:
         dimension = int(dimension)
+    # Ask until we get a winnable number of marks in a row
+    while True:
+        k = input("How many in a row to win? [{}] ".format(dimension))
+        if k == '':
+            k = dimension
+            break
+        if k.isdigit() and 1 <= int(k) <= dimension:
+            k = int(k)
+            break
+        print("Please enter a number from 1 to {}.".format(dimension))
+    if computer == "y" or computer == "yes":
+        computer = Game.O
+    else:
+        computer = None
     playing = True
     while playing:
         # Set up game
-        game = Game(player1, player2, dimension)
+        game = Game(player1, player2, dimension, k, computer)
         # Play!
         game.play()
         # Do we want to play again?
@@ -1,13 +1,19 @@
 from collections import OrderedDict
+from array import array
+from itertools import product
+import json
+import mmap
 import sys
 import os
 import time
 
 class Tracer(object):
-    def __init__(self, columns=6, rows=4):
+    def __init__(self, columns=6, rows=4, start=(0, 0), closed=False):
         self.columns = columns
         self.rows = rows
-        self.position = (0, 0)
+        self.start = start
+        self.closed = closed
+        self.position = start
         self.history = OrderedDict()
         self.history[self.position] = self.possibilities()
 
@@ -19,6 +25,7 @@ class Tracer(object):
         return p
 
     def trace(self):
+        path = self.move(self.position) if self.done() else None
         while not self.done():
             possibilities = self.history[next(reversed(self.history))]
             if possibilities:
@@ -48,7 +55,209 @@ class Tracer(object):
         self.position = next(reversed(self.history))
 
     def done(self):
-        return len(self.history) == self.columns * self.rows
+        if len(self.history) < self.columns * self.rows:
+            return False
+        # A closed tour has to end a knight's move away from where it started.
+        dx, dy = abs(self.position[0] - self.start[0]), abs(self.position[1] - self.start[1])
+        return not self.closed or {dx, dy} == {1, 2} or len(self.history) == 1
+
+class TourCache(object):
+    """
+    Persistent cache of solved tours. Tours are stored back to back in a binary
+    file, one unsigned short (column + row * columns) per square, and looked up
+    through a small JSON index mapping keys like "6x4:0,0:open" to the offset
+    and length of the tour and the time it was last used. The data file is
+    memory mapped on first access, so only the tours actually asked for are
+    ever decoded. Boards without a solution are stored as empty tours.
+    Every tour costs its bytes in the data file plus ENTRY bytes for its index
+    entry. If the total grows beyond max_size bytes, the least recently used
+    tours are evicted. Usage times are only written back on put() and close(),
+    so a lookup never touches the disk beyond reading. If the cache directory
+    can't be created or written, nothing gets cached, and if the data file is
+    missing or damaged, the cache starts over.
+    """
+    ENTRY = 64  # roughly the size of an index entry in the JSON file
+    def __init__(self, directory=None, max_size=1 << 20):
+        if directory is None:
+            directory = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "toffifee")
+        self.data_path = os.path.join(directory, "tours.dat")
+        self.index_path = os.path.join(directory, "tours.json")
+        self.max_size = max_size
+        self.data = None
+        self.dirty = False
+        self.index = {}
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.enabled = True
+        except OSError:
+            # Run without a cache: get() never finds anything, and put() and
+            # close() do nothing.
+            self.enabled = False
+            return
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            # No or broken index: start over.
+            self.index = {}
+            try:
+                open(self.data_path, "wb").close()
+            except OSError:
+                pass
+
+    def reset(self):
+        "The data file is missing or damaged: Forget all tours."
+        self.unmap()
+        self.index = {}
+        self.dirty = True
+        try:
+            open(self.data_path, "wb").close()
+        except OSError:
+            pass
+
+    @staticmethod
+    def key(columns, rows, start, closed):
+        return "{}x{}:{},{}:{}".format(columns, rows, start[0], start[1], "closed" if closed else "open")
+
+    @staticmethod
+    def symmetries(columns, rows):
+        """
+        Generate the 8 symmetries of the board as functions mapping a square of
+        a columns x rows board to the transposed and/or mirrored board, along
+        with the dimensions of that board.
+        """
+        for swap, flip_x, flip_y in product([False, True], repeat=3):
+            def transform(position, swap=swap, flip_x=flip_x, flip_y=flip_y):
+                x, y = position
+                if flip_x:
+                    x = columns - 1 - x
+                if flip_y:
+                    y = rows - 1 - y
+                return (y, x) if swap else (x, y)
+            yield transform, (rows, columns) if swap else (columns, rows)
+
+    def get(self, columns, rows, start=(0, 0), closed=False):
+        """
+        Return the cached tour, [] if there is none, or None if we don't know
+        yet. Tours of transposed or mirrored boards are mapped over to this one.
+        """
+        for transform, (c, r) in TourCache.symmetries(columns, rows):
+            key = TourCache.key(c, r, transform(start), closed)
+            if key in self.index:
+                tour = self.load(key, c)
+                if tour is None:
+                    return None
+                # Map the tour back: Find the symmetry of the cached board that
+                # takes its starting square to ours.
+                for back, dimensions in TourCache.symmetries(c, r):
+                    if dimensions == (columns, rows) and back(transform(start)) == start:
+                        return [back(position) for position in tour]
+        return None
+
+    def load(self, key, columns):
+        """
+        Decode the tour stored under key, or return None (and start over) if
+        the data file doesn't hold it.
+        """
+        offset, length, _ = self.index[key]
+        self.index[key][2] = time.time()
+        self.dirty = True
+        if not length:
+            return []
+        squares = array("H")
+        end = offset + length * squares.itemsize
+        if self.data is None:
+            try:
+                with open(self.data_path, "rb") as f:
+                    self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # No data file, or an empty one, which mmap refuses.
+                self.reset()
+                return None
+        if end > len(self.data):
+            self.reset()
+            return None
+        squares.frombytes(self.data[offset:end])
+        if sys.byteorder == "big":
+            squares.byteswap()
+        return [(square % columns, square // columns) for square in squares]
+
+    def put(self, columns, rows, start, closed, tour):
+        if not self.enabled:
+            return
+        squares = array("H", [x + y * columns for x, y in tour])
+        if sys.byteorder == "big":
+            squares.byteswap()
+        self.unmap()
+        try:
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                squares.tofile(f)
+        except OSError:
+            return
+        self.index[TourCache.key(columns, rows, start, closed)] = [offset, len(squares), time.time()]
+        if self.size() > self.max_size:
+            self.evict()
+        self.save_index()
+
+    @staticmethod
+    def cost(length):
+        "Bytes on disk for a tour of the given length, including its index entry"
+        return length * array("H").itemsize + TourCache.ENTRY
+
+    def size(self):
+        return sum(TourCache.cost(length) for _, length, _ in self.index.values())
+
+    def evict(self):
+        """
+        Drop the least recently used tours until we are below max_size again,
+        then rewrite the data file without the gaps.
+        """
+        itemsize = array("H").itemsize
+        size = 0
+        keep = {}
+        for key, (offset, length, used) in sorted(self.index.items(), key=lambda item: -item[1][2]):
+            size += TourCache.cost(length)
+            if size > self.max_size:
+                break
+            keep[key] = (offset, length, used)
+        try:
+            with open(self.data_path, "rb") as f:
+                old = f.read()
+        except OSError:
+            return
+        try:
+            with open(self.data_path, "wb") as f:
+                for key, (offset, length, used) in list(keep.items()):
+                    if offset + length * itemsize > len(old):
+                        # Lost from a damaged data file.
+                        del keep[key]
+                        continue
+                    keep[key] = [f.tell(), length, used]
+                    f.write(old[offset:offset + length * itemsize])
+        except OSError:
+            # We failed halfway through rewriting the data file.
+            keep = {}
+        self.index = keep
+
+    def save_index(self):
+        try:
+            with open(self.index_path, "w") as f:
+                json.dump(self.index, f)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def unmap(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def close(self):
+        "Release the data file and write back the usage times of the last lookups"
+        self.unmap()
+        if self.enabled and self.dirty:
+            self.save_index()
 
 def print_there(row, col, text):
     sys.stdout.write("\x1b7\x1b[%d;%df%s\x1b8" % (row + 6, col + 6, text))
@@ -58,17 +267,39 @@ if __name__ == '__main__':
     os.system("clear")
     a = int(input("Columns: "))
     b = int(input("Rows: "))
-    t = Tracer(a, b)
-    print("Calculating...")
-    solution = t.trace()
+    while True:
+        start = input("Start square (column, row)? [0, 0] ")
+        # Set default values in case the user has just hit enter
+        if start == "":
+            start = (0, 0)
+            break
+        try:
+            start = tuple(int(n) for n in start.split(","))
+        except ValueError:
+            start = ()
+        if len(start) == 2 and 0 <= start[0] < a and 0 <= start[1] < b:
+            break
+        print("Please enter a column from 0 to {} and a row from 0 to {}, like 1, 2.".format(a - 1, b - 1))
+    closed = input("Closed tour (y/n)? [n] ")
+    closed = closed == "y" or closed == "yes"
+    cache = TourCache()
+    solution = cache.get(a, b, start, closed)
+    if solution is None:
+        t = Tracer(a, b, start, closed)
+        print("Calculating...")
+        solution = t.trace() or []
+        cache.put(a, b, start, closed, solution)
+    elif not solution:
+        print("No solution fond!")
+    cache.close()
     if solution:
         os.system("setterm -cursor off")
         for row in range(b):
             for col in range(a):
                     print_there(row, col, "*")
-        prev_row, prev_col = 0, 0
+        prev_row, prev_col = solution[0]
         pawn = u"\u265e"
-        print_there(solution[0][0], solution[0][1], "\033[92m" + pawn)
+        print_there(prev_col, prev_row, "\033[92m" + pawn)
         time.sleep(1)
         for row, col in solution[1:]:
             print_there(prev_col, prev_row, "\033[94m*")